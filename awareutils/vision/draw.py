@@ -46,6 +46,9 @@ class Drawer(metaclass=ABCMeta):
         if not isinstance(width, int):
             raise ValueError("width should be an int")
 
+        # We're about to draw on the source, so any cached conversions will be stale:
+        self.img.invalidate_cache()
+
         # Re-project if needed
         if self.img.isize != shape._isize:
             if self._reproject_shapes_if_required:
@@ -219,6 +222,8 @@ class OpenCVDrawer(Drawer):
         return self._polyline(polyline=polygon, closed=True, fill=fill, outline=outline, width=width)
 
     def circle(self, circle: Circle, fill: Col = None, outline: Col = None, width: int = 1) -> None:
+        self._contiguity_test()
+        circle = self._check_args(shape=circle, outline=outline, fill=fill, width=width)
         # Always fill first:
         center = (circle.center.x, circle.center.y)
         if fill is not None:
@@ -285,6 +290,7 @@ class OpenCVDrawer(Drawer):
         line_type=cv2.LINE_AA,
     ) -> Rectangle:
         self._contiguity_test()
+        self.img.invalidate_cache()
         # Figure out how high font needs to be:
         font_pixel_height = int(round(max(1, self.img.h * height), 0))
         font_scale = self._calculate_font_scale(font, font_pixel_height, width)
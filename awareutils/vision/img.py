@@ -1,7 +1,12 @@
 import json
+import mmap
+import os
+import struct
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum, auto, unique
 from pathlib import Path
-from typing import Dict, Optional, Union
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 import numpy as np
 from awareutils.vision.col import Col
@@ -21,12 +26,84 @@ try:
 except ImportError:
     from awareutils.vision.mock import piexif
 
+# Files bigger than this are memory mapped (rather than read) when decoding with cv2. For small files, it's not worth
+# the overhead of setting up the mapping.
+_MMAP_MIN_FILE_SIZE = 1 << 20
+
+_EXIF_IFD_POINTER_TAG = 0x8769
+_EXIF_USER_COMMENT_TAG = 0x9286
+
+
+def _read_exif_user_comment(exif: bytes) -> Optional[bytes]:
+    """
+    Pull just the UserComment (where we keep our metadata) out of raw EXIF bytes. piexif.load parses every tag in
+    every IFD in pure Python (including thumbnails, maker notes, etc. for camera imgs) whereas we only need to walk
+    IFD0 to find the Exif IFD, and then that to find the UserComment, so this is a lot cheaper.
+    """
+    if exif.startswith(b"Exif\x00\x00"):
+        exif = exif[6:]
+    if exif[:2] == b"II":
+        endian = "<"
+    elif exif[:2] == b"MM":
+        endian = ">"
+    else:
+        raise RuntimeError("Invalid EXIF - unknown byte order")
+
+    def find_tag(ifd_offset: int, tag: int) -> Optional[Tuple[int, int]]:
+        # Return the (count, value/offset) of the tag, if it's in the IFD
+        (n_entries,) = struct.unpack_from(f"{endian}H", exif, ifd_offset)
+        for entry_offset in range(ifd_offset + 2, ifd_offset + 2 + 12 * n_entries, 12):
+            entry_tag, _, count, value = struct.unpack_from(f"{endian}HHLL", exif, entry_offset)
+            if entry_tag == tag:
+                return count, value
+        return None
+
+    (ifd0_offset,) = struct.unpack_from(f"{endian}L", exif, 4)
+    exif_ifd = find_tag(ifd0_offset, _EXIF_IFD_POINTER_TAG)
+    if exif_ifd is None:
+        return None
+    user_comment = find_tag(exif_ifd[1], _EXIF_USER_COMMENT_TAG)
+    if user_comment is None:
+        return None
+    count, offset = user_comment
+    if count <= 4:
+        # Small values are stored in the entry itself, rather than at an offset
+        return struct.pack(f"{endian}L", offset)[:count]
+    return exif[offset : offset + count]
+
 
 @unique
 class ImgType(Enum):
     BGR = auto()
     RGB = auto()
     PIL = auto()
+    # Channels first i.e. (3, h, w). Handy for per-channel (planar) processing e.g. filling a channel is a single
+    # contiguous write, rather than a strided one.
+    RGB_PLANAR = auto()
+
+
+@unique
+class Interpolation(Enum):
+    """
+    Interpolation for resizing, consistent between OpenCV and PIL. (AREA is PIL's BOX, which is the same idea.)
+    """
+
+    NEAREST = auto()
+    LINEAR = auto()
+    CUBIC = auto()
+    AREA = auto()
+
+    # NB: these are looked up when used (rather than stored as the enum values) so we don't need both cv2 and PIL.
+    @property
+    def cv2(self) -> int:
+        return getattr(cv2, f"INTER_{self.name}")
+
+    @property
+    def pil(self) -> int:
+        return getattr(PILImageModule, _PIL_RESAMPLE_NAMES[self.name])
+
+
+_PIL_RESAMPLE_NAMES = {"NEAREST": "NEAREST", "LINEAR": "BILINEAR", "CUBIC": "BICUBIC", "AREA": "BOX"}
 
 
 class ImgSize:
@@ -55,6 +132,45 @@ class ImgSize:
         return self.__class__(h=self.h, w=self.w)
 
 
+class BufferPool:
+    """
+    Recycle arrays of the same shape, rather than allocating new ones e.g. for `img.bgr(out=...)` when processing
+    video frames. Fresh arrays are surprisingly expensive, as the OS has to map (and zero) new pages the first time
+    they're written to.
+
+        pool = BufferPool()
+        for img in imgs:
+            bgr = img.bgr(out=pool.get((img.h, img.w, 3)))
+            ...
+            pool.release(bgr)
+    """
+
+    def __init__(self, max_per_shape: int = 4):
+        self._max_per_shape = max_per_shape
+        self._free: Dict[Tuple, List[np.ndarray]] = defaultdict(list)
+
+    def get(self, shape: Tuple[int, ...], dtype: np.dtype = np.uint8) -> np.ndarray:
+        """
+        Get an array of this shape/dtype. Note its contents are undefined i.e. whatever was there last time.
+        """
+        free = self._free[(tuple(shape), np.dtype(dtype))]
+        if free:
+            return free.pop()
+        return np.empty(shape, dtype)
+
+    def release(self, arr: np.ndarray) -> None:
+        """
+        Return an array to the pool so it can be reused. Don't use it after this!
+        """
+        if not arr.flags.c_contiguous:
+            # Conversions won't write into these, so they're no use to pool
+            raise ValueError("Only contiguous arrays can be released to the pool")
+        free = self._free[(arr.shape, arr.dtype)]
+        # Don't add it twice, else two later gets would share it:
+        if len(free) < self._max_per_shape and not any(a is arr for a in free):
+            free.append(arr)
+
+
 # Uggh, circular imports. Other things e.g. shape want ImgSize, so let's give them that first above. Note that we could
 # define ImgSize in a different file which would also resolve the circular imports, but I reckon it's pretty tied to
 # Img, so let's leave it here and accept this slight hack.
@@ -68,8 +184,38 @@ class Img:
             using rgb arrays, and likewise bgr or PIL. Nice utilities for converting between formats.
         - Nice attributes like height/width/etc.
         - Custom json-serializable metadata store in the UserComment field of EXIF.
+
+    Conversions (e.g. `img.rgb()` on a BGR img) are cached, so calling them repeatedly is free. Note this means the
+    converted arrays are shared, so don't mutate them in place - and if you mutate `img.source` in place yourself
+    (other than via `img.draw`, which handles it), call `img.invalidate_cache()` afterwards.
+
+    Under the hood, `Img(...)` gives you a (private) subclass specialized for the `itype`, so conversions don't have to
+    check the type each time. You can treat it as an `Img` as usual.
     """
 
+    __slots__ = (
+        "_source",
+        "itype",
+        "_metadata",
+        "_exif_cache",
+        "make_arrays_contiguous",
+        "_is_known_contiguous",
+        "_draw",
+        "isize",
+        "h",
+        "w",
+        "_rgb",
+        "_bgr",
+        "_pil",
+        "_rgb_planar",
+    )
+
+    def __new__(cls, source=None, itype: Optional[ImgType] = None, *args, **kwargs):
+        # Create the subclass specialized for this itype:
+        if cls is Img and itype in _IMG_CLASSES:
+            cls = _IMG_CLASSES[itype]
+        return super().__new__(cls)
+
     def __init__(
         self,
         source: Union[np.ndarray, "PILImageModule.Image"],
@@ -77,39 +223,71 @@ class Img:
         metadata: Optional[Dict] = None,
         make_arrays_contiguous: bool = True,
     ):
-        self.source = source
         self.itype = itype
         self._metadata = metadata
+        self._exif_cache = None
         self.make_arrays_contiguous = make_arrays_contiguous
 
         if self.itype == ImgType.PIL:
             if not isinstance(source, PILImageModule.Image):
                 raise RuntimeError("Set source type to PIL but source isn't a PIL Image")
-        elif self.itype in (ImgType.RGB, ImgType.BGR):
+        elif self.itype in (ImgType.RGB, ImgType.BGR, ImgType.RGB_PLANAR):
             if not isinstance(source, np.ndarray):
                 raise RuntimeError(f"Set source to {self.itype.name} but isn't an np.ndarray")
+            if self.itype == ImgType.RGB_PLANAR and (source.ndim != 3 or source.shape[0] != 3):
+                raise RuntimeError("Set source to RGB_PLANAR but it isn't a (3, h, w) array")
             if not source.flags.c_contiguous:
                 if make_arrays_contiguous:
                     source = np.ascontiguousarray(source)
                 else:
-                    logger.warn("Source isn't contiguous which can cause subtle OpenCV problems.")
+                    logger.warning("Source isn't contiguous which can cause subtle OpenCV problems.")
 
         else:
             raise RuntimeError("Unknown source type")
-
-        self._draw = None
+        self.source = source
 
         # Set some attributes for performance (as they are commonly accesses and often in loops etc.):
         self.isize = self._get_size()
         self.h = self.isize.h
         self.w = self.isize.w
 
-    def _get_size(self) -> ImgSize:
-        if self.itype == ImgType.PIL:
-            h, w = self.source.height, self.source.width
-        elif self.itype in (ImgType.BGR, ImgType.RGB):
-            h, w = self.source.shape[:2]
-        return ImgSize(w=w, h=h)
+    @property
+    def source(self) -> Union[np.ndarray, "PILImageModule.Image"]:
+        return self._source
+
+    @source.setter
+    def source(self, value: Union[np.ndarray, "PILImageModule.Image"]) -> None:
+        self._source = value
+        # Whether we know the source is contiguous (PIL imgs always are), so we can skip checks/copies when converting:
+        self._is_known_contiguous = not isinstance(value, np.ndarray) or value.flags.c_contiguous
+        # Drawers hold on to the source (e.g. PIL's ImageDraw), so we need a new one for the new source:
+        self._draw = None
+        self.invalidate_cache()
+
+    def invalidate_cache(self) -> None:
+        """
+        Clear any cached conversions of the source e.g. after it's been drawn on in place.
+        """
+        self._rgb = self._bgr = self._pil = self._rgb_planar = None
+        # The source is its own conversion (so long as it doesn't need making contiguous first):
+        if self._is_known_contiguous or not self.make_arrays_contiguous:
+            setattr(self, self._own_slot, self._source)
+
+    # Per-itype class attributes, set by the subclass for each itype. As with the conversions below, these properties
+    # are only used by user subclasses of Img. `_own_slot` is the cache slot the source fills, and `_rgb_from_bgr_view`
+    # / `_bgr_from_rgb_view` say whether `rgb(copy=False)` / `bgr(copy=False)` should return a channel-reversed view of
+    # the other instead of converting.
+    @property
+    def _own_slot(self) -> str:
+        return _IMG_CLASSES[self.itype]._own_slot
+
+    @property
+    def _rgb_from_bgr_view(self) -> bool:
+        return _IMG_CLASSES[self.itype]._rgb_from_bgr_view
+
+    @property
+    def _bgr_from_rgb_view(self) -> bool:
+        return _IMG_CLASSES[self.itype]._bgr_from_rgb_view
 
     @property
     def metadata(self) -> Optional[Dict]:
@@ -120,21 +298,33 @@ class Img:
         if not isinstance(value, Dict):
             raise ValueError("value must be a dict")
         self._metadata = value
+        self._exif_cache = None
 
     @staticmethod
-    def _pil_to_numpy_rgb(img: PILImageModule.Image) -> np.ndarray:
+    def _pil_to_numpy(
+        img: PILImageModule.Image, rawmode: Optional[str] = None, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
         """
         See https://uploadcare.com/blog/fast-import-of-pillow-images-to-numpy-opencv-arrays/ Can be 2-3x faster.
+
+        Use `rawmode` to have PIL pack the pixels in a different order as it copies them out e.g. "BGR" for an RGB img
+        gets us a BGR array in a single pass, instead of copying and then converting with cv2. If `out` is provided,
+        the pixels are written into that instead of a new array.
         """
 
         img.load()
         # unpack data
-        e = PILImageModule._getencoder(img.mode, "raw", img.mode)
-        e.setimage(img.im)
+        e = PILImageModule._getencoder(img.mode, "raw", img.mode if rawmode is None else rawmode)
+        e.setimage(img.im, (0, 0) + img.size)
 
         # NumPy buffer for the result
         shape, typestr = PILImageModule._conv_type_shape(img)
-        rgb = np.empty(shape, dtype=np.dtype(typestr))
+        if out is None:
+            rgb = np.empty(shape, dtype=np.dtype(typestr))
+        elif out.shape != tuple(shape) or out.dtype != np.dtype(typestr):
+            raise ValueError(f"out should be a {np.dtype(typestr)} array of shape {tuple(shape)}")
+        else:
+            rgb = out
         mem = rgb.data.cast("B", (rgb.data.nbytes,))
 
         bufsize, s, offset = 65536, 0, 0
@@ -146,56 +336,187 @@ class Img:
             raise RuntimeError("encoder error %d in tobytes" % s)
         return rgb
 
-    def rgb(self) -> np.ndarray:
-        if self.itype == ImgType.PIL:
-            arr = self._pil_to_numpy_rgb(self.source)
-        elif self.itype == ImgType.RGB:
-            arr = self.source
-        elif self.itype == ImgType.BGR:
-            arr = cv2.cvtColor(self.source, cv2.COLOR_BGR2RGB)
-
-        # Make contiguous if required:
-        if self.make_arrays_contiguous:
+    def _contiguous(self, arr: np.ndarray) -> np.ndarray:
+        """
+        Make `arr` contiguous if we've been asked to (and it isn't already). Only use this for arrays that might be
+        views of user-supplied data - the arrays we get back from PIL and cv2 are always fresh contiguous buffers, so
+        there's no need to check (let alone copy) them again.
+        """
+        if self.make_arrays_contiguous and not arr.flags.c_contiguous:
             return np.ascontiguousarray(arr)
         return arr
 
-    def bgr(self) -> np.ndarray:
-        if self.itype == ImgType.PIL:
-            arr = cv2.cvtColor(self._pil_to_numpy_rgb(self.source), cv2.COLOR_RGB2BGR)
-        elif self.itype == ImgType.RGB:
-            arr = cv2.cvtColor(self.source, cv2.COLOR_RGB2BGR)
-        elif self.itype == ImgType.BGR:
-            arr = self.source
-
-        # Make contiguous if required:
-        if self.make_arrays_contiguous:
-            return np.ascontiguousarray(arr)
-        return arr
+    def rgb(self, copy: bool = True, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Get the img as an RGB array. If `copy=False` and a conversion is needed, we return a (non-contiguous,
+        uncached) channel-reversed view instead of converting - this is free, but only use it if you're just reading
+        the pixels (and aren't passing it to OpenCV, which often wants contiguous arrays).
+
+        If `out` is provided, the RGB pixels are written into it (and it's returned) instead of into a new (cached)
+        array. Reusing the same `out` for e.g. every frame of a video saves allocating (and page-faulting) a new array
+        each time - see `BufferPool`.
+        """
+        if out is not None:
+            return self._convert_into(out, cached=self._rgb, convert=self._to_rgb)
+        if self._rgb is not None:
+            return self._rgb
+        if not copy and self._rgb_from_bgr_view:
+            bgr = self.bgr()
+            # Only a plain 3 channel array can be reversed - anything else (e.g. from an RGBA PIL img) needs converting:
+            if bgr.ndim == 3 and bgr.shape[2] == 3:
+                return bgr[..., ::-1]
+        return self._compute_rgb()
+
+    def bgr(self, copy: bool = True, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Get the img as a BGR array. See `rgb` for `copy` and `out`.
+        """
+        if out is not None:
+            return self._convert_into(out, cached=self._bgr, convert=self._to_bgr)
+        if self._bgr is not None:
+            return self._bgr
+        if not copy and self._bgr_from_rgb_view:
+            rgb = self.rgb()
+            # Only a plain 3 channel array can be reversed - anything else (e.g. from an RGBA PIL img) needs converting:
+            if rgb.ndim == 3 and rgb.shape[2] == 3:
+                return rgb[..., ::-1]
+        return self._compute_bgr()
 
     def pil(self) -> "PILImageModule.Image":
-        if self.itype == ImgType.PIL:
-            return self.source
-        elif self.itype == ImgType.RGB:
-            return PILImageModule.fromarray(np.ascontiguousarray(self.source))
-        elif self.itype == ImgType.BGR:
-            return PILImageModule.fromarray(np.ascontiguousarray(self.bgr()))
+        return self._pil if self._pil is not None else self._compute_pil()
+
+    def rgb_planar(self) -> np.ndarray:
+        """
+        Get the img as a channels-first (3, h, w) RGB array.
+        """
+        return self._rgb_planar if self._rgb_planar is not None else self._compute_rgb_planar()
+
+    def _convert_into(self, out: np.ndarray, cached: Optional[np.ndarray], convert: Callable) -> np.ndarray:
+        # NB: PIL imgs don't have a dtype, but the arrays we get from them are always uint8:
+        dtype = getattr(self._source, "dtype", np.uint8)
+        if out.shape != (self.h, self.w, 3) or out.dtype != dtype or not out.flags.c_contiguous:
+            # NB: we have to check this, as otherwise cv2 will silently allocate a new array instead of using `out`
+            raise ValueError(f"out should be a contiguous {dtype} array of shape {(self.h, self.w, 3)}")
+        if cached is not None:
+            np.copyto(out, cached)
+            return out
+        return convert(out=out)
+
+    def _compute_rgb(self) -> np.ndarray:
+        self._rgb = self._to_rgb()
+        return self._rgb
+
+    def _compute_bgr(self) -> np.ndarray:
+        self._bgr = self._to_bgr()
+        return self._bgr
+
+    def _compute_pil(self) -> "PILImageModule.Image":
+        self._pil = self._to_pil()
+        return self._pil
+
+    def _compute_rgb_planar(self) -> np.ndarray:
+        self._rgb_planar = self._to_rgb_planar()
+        return self._rgb_planar
+
+    # The actual conversions. These are implemented by the subclass for each itype (see _IMG_CLASSES) so there's no
+    # branching on self.itype every call, which matters when e.g. converting many small crops. The array ones can write
+    # into `out`. The versions here are only used by user subclasses of Img (which we don't specialize) and just look
+    # up the specialized implementation each time.
+    def _get_size(self) -> ImgSize:
+        return _IMG_CLASSES[self.itype]._get_size(self)
+
+    def _to_rgb(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return _IMG_CLASSES[self.itype]._to_rgb(self, out=out)
+
+    def _to_bgr(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return _IMG_CLASSES[self.itype]._to_bgr(self, out=out)
+
+    def _to_pil(self) -> "PILImageModule.Image":
+        return _IMG_CLASSES[self.itype]._to_pil(self)
+
+    def _to_rgb_planar(self) -> np.ndarray:
+        return _IMG_CLASSES[self.itype]._to_rgb_planar(self)
+
+    @staticmethod
+    def _batch(imgs: List["Img"], out: Optional[np.ndarray], convert: Callable) -> np.ndarray:
+        if not imgs:
+            raise ValueError("imgs must not be empty")
+        isize = imgs[0].isize
+        if any(img.isize != isize for img in imgs):
+            raise ValueError("All imgs must be the same size")
+        shape = (len(imgs), isize.h, isize.w, 3)
+        # NB: PIL imgs don't have a dtype, but the arrays we get from them are always uint8:
+        dtype = getattr(imgs[0].source, "dtype", np.uint8)
+        if out is None:
+            out = np.empty(shape, dtype)
+        elif out.shape != shape or out.dtype != dtype or not out.flags.c_contiguous:
+            raise ValueError(f"out should be a contiguous {dtype} array of shape {shape}")
+        # Convert each img straight into its slot in the batch, rather than converting them and then stacking (which
+        # would be another full copy):
+        for img, img_out in zip(imgs, out):
+            convert(img, out=img_out)
+        return out
+
+    @classmethod
+    def batch_rgb(cls, imgs: List["Img"], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Get a list of same-sized imgs as a single (n, h, w, 3) RGB array e.g. for batching into a model. See `rgb` for
+        `out`.
+        """
+        return cls._batch(imgs, out=out, convert=Img.rgb)
+
+    @classmethod
+    def batch_bgr(cls, imgs: List["Img"], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Get a list of same-sized imgs as a single (n, h, w, 3) BGR array. See `batch_rgb`.
+        """
+        return cls._batch(imgs, out=out, convert=Img.bgr)
+
+    @staticmethod
+    def _cv2_imread(path: str) -> np.ndarray:
+        """
+        Like cv2.imread, but for big files we memory map the file and decode from that, which saves cv2 reading the
+        whole (encoded) file into its own buffer first.
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            # Let cv2 fail on it below
+            size = 0
+        if size >= _MMAP_MIN_FILE_SIZE:
+            try:
+                with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    buf = np.frombuffer(mm, np.uint8)
+                    try:
+                        source = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+                    finally:
+                        # Release our view of the mmap, else it can't be closed (even if decoding failed)
+                        del buf
+            except OSError as e:
+                # Fail the same way cv2.imread would have, e.g. for a file we can't read:
+                raise RuntimeError("Failed to read with cv2") from e
+        else:
+            source = cv2.imread(path)
+        if source is None:
+            raise RuntimeError("Failed to read with cv2")
+        return source
 
     @classmethod
     def open(cls, path: Union[Path, str], itype: ImgType, load_metadata: bool = False) -> "Img":
-        if not isinstance(path, (Path, str)):
-            raise ValueError("path must be a Path or str")
-        path = str(path)
+        # Don't re-str a str - this is called a lot when loading many (small) imgs:
+        if type(path) is not str:
+            if not isinstance(path, (Path, str)):
+                raise ValueError("path must be a Path or str")
+            path = str(path)
+        if itype == ImgType.RGB_PLANAR:
+            # Nothing reads planar directly, so read as BGR and convert:
+            img = cls.open(path, itype=ImgType.BGR, load_metadata=load_metadata)
+            return cls(source=img.rgb_planar(), itype=ImgType.RGB_PLANAR, metadata=img.metadata)
         if not load_metadata:
             if itype == ImgType.BGR:
-                source = cv2.imread(path)
-                if source is None:
-                    raise RuntimeError("Failed to read with cv2")
-                return cls(source=source, itype=ImgType.BGR)
+                return cls(source=cls._cv2_imread(path), itype=ImgType.BGR)
             elif itype == ImgType.RGB:
-                source = cv2.imread(path)
-                if source is None:
-                    raise RuntimeError("Failed to read with cv2")
-                source = cv2.cvtColor(source, cv2.COLOR_BGR2RGB)
+                source = cv2.cvtColor(cls._cv2_imread(path), cv2.COLOR_BGR2RGB)
                 return cls(source=source, itype=ImgType.RGB)
             elif itype == ImgType.PIL:
                 return cls(source=PILImageModule.open(path), itype=ImgType.PIL)
@@ -205,16 +526,50 @@ class Img:
             if load_metadata:
                 meta = pil.info.get("exif")
                 if meta is not None:
-                    meta = piexif.load(meta)["Exif"][piexif.ExifIFD.UserComment]
+                    meta = _read_exif_user_comment(meta)
+                if meta is not None:
                     meta = json.loads(meta)
             if itype == ImgType.BGR:
-                rgb = np.array(pil)
-                return cls(source=cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), itype=ImgType.BGR, metadata=meta)
+                if pil.mode == "RGB":
+                    bgr = cls._pil_to_numpy(pil, rawmode="BGR")
+                else:
+                    bgr = cv2.cvtColor(np.asarray(pil), cv2.COLOR_RGB2BGR)
+                return cls(source=bgr, itype=ImgType.BGR, metadata=meta)
             elif itype == ImgType.RGB:
-                return cls(source=np.array(pil), itype=ImgType.RGB, metadata=meta)
+                return cls(source=cls._pil_to_numpy(pil), itype=ImgType.RGB, metadata=meta)
             elif itype == ImgType.PIL:
                 return cls(source=pil, itype=ImgType.PIL, metadata=meta)
 
+    @classmethod
+    def open_batch(
+        cls,
+        paths: Iterable[Union[Path, str]],
+        itype: ImgType,
+        load_metadata: bool = False,
+        max_workers: Optional[int] = None,
+    ) -> List["Img"]:
+        """
+        Open many imgs at once, in parallel threads. The reading and decoding (in cv2/PIL) releases the GIL, so this
+        can be a lot faster than opening them one by one - especially if there's IO latency. PIL imgs are loaded (i.e.
+        decoded, and their files closed) in the threads too, instead of lazily on first use.
+        """
+
+        def _open(path: Union[Path, str]) -> "Img":
+            img = cls.open(path, itype=itype, load_metadata=load_metadata)
+            if itype == ImgType.PIL:
+                # PIL only reads the header on open, so make it decode here (and close the file):
+                img.source.load()
+            return img
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_open, paths))
+
+    @classmethod
+    def open_bgr_batch(
+        cls, paths: Iterable[Union[Path, str]], load_metadata: bool = False, max_workers: Optional[int] = None
+    ) -> List["Img"]:
+        return cls.open_batch(paths=paths, itype=ImgType.BGR, load_metadata=load_metadata, max_workers=max_workers)
+
     @classmethod
     def open_pil(cls, path: Union[Path, str], load_metadata: bool = False) -> "Img":
         return cls.open(path=path, itype=ImgType.PIL, load_metadata=load_metadata)
@@ -227,10 +582,28 @@ class Img:
     def open_rgb(cls, path: Union[Path, str], load_metadata: bool = False) -> "Img":
         return cls.open(path=path, itype=ImgType.RGB, load_metadata=load_metadata)
 
-    def save(self, path: Union[Path, str], save_metadata: bool = True, **kwargs) -> None:
-        if not isinstance(path, (Path, str)):
-            raise ValueError("path must be a Path or str")
-        path = str(path)
+    def _metadata_exif(self) -> bytes:
+        """
+        Get the EXIF bytes for our metadata. piexif.dump is slow (pure Python) so we cache it, e.g. for saving the same
+        img in multiple places/formats. We key it by the json (which is cheap to create) rather than just clearing it
+        in the metadata setter, as the metadata dict could have been changed in place.
+        """
+        comment = json.dumps(self._metadata).encode("utf8")
+        if self._exif_cache is None or self._exif_cache[0] != comment:
+            self._exif_cache = (comment, piexif.dump({"Exif": {piexif.ExifIFD.UserComment: comment}}))
+        return self._exif_cache[1]
+
+    def save(self, path: Union[Path, str], save_metadata: bool = True, optimize: bool = False, **kwargs) -> None:
+        """
+        Save the img. `optimize` has PIL do an extra encoding pass for a (usually only slightly) smaller file e.g.
+        optimal Huffman tables for JPEG - it's a lot slower, so it's off by default. It only applies when saving with
+        PIL (i.e. for PIL imgs, or if we're saving metadata). Other `kwargs` are passed to PIL's `save`.
+        """
+        # Don't re-str a str - this is called a lot when saving many (small) imgs:
+        if type(path) is not str:
+            if not isinstance(path, (Path, str)):
+                raise ValueError("path must be a Path or str")
+            path = str(path)
         should_save_metadata = save_metadata and self._metadata is not None
         # If we're saving metadata, it's got to be PIL:
         if self.itype == ImgType.PIL or should_save_metadata:
@@ -240,32 +613,44 @@ class Img:
                     raise RuntimeError(
                         "We're saving metadata in EXIF already, so it's unsupported for you to use it too!"
                     )
-                exif_dict = {"Exif": {piexif.ExifIFD.UserComment: json.dumps(self._metadata).encode("utf8")}}
-                kwargs["exif"] = piexif.dump(exif_dict)
+                kwargs["exif"] = self._metadata_exif()
 
-            # Default to optimize=True. This means we'll get failures for any save methods that don't supported
-            # `optimize` but since these are uncommon (and the user can fix this by setting optimize=False), meh.
-            if "optimize" not in kwargs:
+            # Only pass it if it's wanted, so formats that don't support it still work by default:
+            if optimize:
                 kwargs["optimize"] = True
 
             pil.save(path, **kwargs)
-        elif self.itype == ImgType.RGB:
-            cv2.imwrite(path, cv2.cvtColor(self.source, cv2.COLOR_RGB2BGR))
-        elif self.itype == ImgType.BGR:
-            cv2.imwrite(path, self.source)
+        else:
+            cv2.imwrite(path, self.bgr())
 
-    def resize(self, isize: ImgSize) -> "Img":
+    def resize(self, isize: ImgSize, interpolation: Optional[Interpolation] = None) -> "Img":
         """
-        Resize the image
+        Resize the image. If `interpolation` isn't given, we use AREA if we're shrinking the img (it's both faster and
+        better quality for downscaling) and LINEAR otherwise.
         """
-        # TODO: support different sampling
-        # TODO: test
+        if interpolation is None:
+            if isize.w < self.w and isize.h < self.h:
+                interpolation = Interpolation.AREA
+            else:
+                interpolation = Interpolation.LINEAR
         if self.itype == ImgType.PIL:
-            return Img(source=self.source.resize(size=(isize.w, isize.h)), itype=self.itype, metadata=self._metadata)
+            source = self.source.resize(size=(isize.w, isize.h), resample=interpolation.pil)
+            return Img(source=source, itype=self.itype, metadata=self._metadata)
         elif self.itype in (ImgType.RGB, ImgType.BGR):
-            return Img(source=cv2.resize(self.source, (isize.w, isize.h)), itype=self.itype, metadata=self._metadata)
+            source = cv2.resize(self.source, (isize.w, isize.h), interpolation=interpolation.cv2)
+            return Img(source=source, itype=self.itype, metadata=self._metadata)
+        elif self.itype == ImgType.RGB_PLANAR:
+            flag = interpolation.cv2
+            source = np.stack([cv2.resize(plane, (isize.w, isize.h), interpolation=flag) for plane in self.source])
+            return Img(source=source, itype=self.itype, metadata=self._metadata)
 
     def crop(self, rectangle: Rectangle, copy: bool = False) -> "Img":
+        """
+        Crop the img to the rectangle. With `copy=False` array crops are views of this img (like slicing in numpy), so
+        changes to one show in the other - and the crop's source usually isn't contiguous (though its conversions
+        will be, if we're making arrays contiguous). PIL crops are always copies (PIL stopped doing lazy crops in
+        Pillow 3.4) so `copy` makes no difference.
+        """
         if rectangle._isize != self.isize:
             raise RuntimeError(
                 (
@@ -274,8 +659,6 @@ class Img:
                 )
             )
         if self.itype == ImgType.PIL:
-            if not copy:
-                raise RuntimeError("PIL crops are always copys. I think?")
             return Img(
                 source=self.source.crop((rectangle.x0, rectangle.y0, rectangle.x1 + 1, rectangle.y1 + 1)),
                 itype=self.itype,
@@ -284,8 +667,29 @@ class Img:
         elif self.itype in (ImgType.RGB, ImgType.BGR):
             source = rectangle.slice_array(self.source)
             if copy:
-                source = source.copy()
-            return Img(source=source, itype=self.itype, metadata=self._metadata)
+                return Img(source=source.copy(), itype=self.itype, metadata=self._metadata)
+            return self._view(source)
+        elif self.itype == ImgType.RGB_PLANAR:
+            source = self.source[:, rectangle.y0 : rectangle.y1 + 1, rectangle.x0 : rectangle.x1 + 1]
+            if copy:
+                return Img(source=source.copy(), itype=self.itype, metadata=self._metadata)
+            return self._view(source)
+
+    def _view(self, source: np.ndarray) -> "Img":
+        """
+        Create an img like this one from a view of our source. Unlike the constructor, this doesn't make the source
+        contiguous (which would copy it) so the new img stays a view - its conversions are still made contiguous.
+        """
+        img = Img.__new__(Img, itype=self.itype)
+        img.itype = self.itype
+        img._metadata = self._metadata
+        img._exif_cache = None
+        img.make_arrays_contiguous = self.make_arrays_contiguous
+        img.source = source
+        img.isize = img._get_size()
+        img.h = img.isize.h
+        img.w = img.isize.w
+        return img
 
     @classmethod
     def from_bgr(cls, array: np.ndarray, metadata: Optional[Dict] = None, make_arrays_contiguous: bool = True):
@@ -295,6 +699,12 @@ class Img:
     def from_rgb(cls, array: np.ndarray, metadata: Optional[Dict] = None, make_arrays_contiguous: bool = True):
         return cls(source=array, itype=ImgType.RGB, metadata=metadata, make_arrays_contiguous=make_arrays_contiguous)
 
+    @classmethod
+    def from_rgb_planar(cls, array: np.ndarray, metadata: Optional[Dict] = None, make_arrays_contiguous: bool = True):
+        return cls(
+            source=array, itype=ImgType.RGB_PLANAR, metadata=metadata, make_arrays_contiguous=make_arrays_contiguous
+        )
+
     @classmethod
     def from_pil(cls, pil: PILImageModule.Image, metadata: Optional[Dict] = None):
         return cls(source=pil, itype=ImgType.PIL, metadata=metadata)
@@ -315,6 +725,11 @@ class Img:
             source = np.zeros((size.h, size.w, 3), np.uint8)
             source[:, :, :] = col.rgb if itype == ImgType.RGB else col.bgr
             return Img(source=source, itype=itype, metadata=metadata)
+        elif itype == ImgType.RGB_PLANAR:
+            source = np.empty((3, size.h, size.w), np.uint8)
+            for plane, c in zip(source, col.rgb):
+                plane.fill(c)
+            return Img(source=source, itype=itype, metadata=metadata)
 
     @classmethod
     def new_pil(
@@ -343,11 +758,134 @@ class Img:
     ) -> "Img":
         return cls.new(size=size, itype=ImgType.RGB, metadata=metadata, col=col)
 
+    @classmethod
+    def new_rgb_planar(
+        cls,
+        size: ImgSize,
+        col: Col = Col.named.black,
+        metadata: Optional[Dict] = None,
+    ) -> "Img":
+        return cls.new(size=size, itype=ImgType.RGB_PLANAR, metadata=metadata, col=col)
+
     @property
     def draw(self) -> Union["Drawer"]:
         raise NotImplementedError("You shouldn't be seeing this ... it should be overridden")
 
 
+class _SpecializedImg(Img):
+    """
+    Base for the per-itype specializations of Img. NB: the methods of these are also called (unbound) with user
+    subclasses of Img as `self`, so they must only use Img's own attributes/methods, and not super() etc.
+    """
+
+    __slots__ = ()
+    _rgb_from_bgr_view = False
+    _bgr_from_rgb_view = True
+
+    def _to_pil(self) -> "PILImageModule.Image":
+        # No need to make it contiguous first - PIL copies the pixels out either way, and handles strides fine.
+        return PILImageModule.fromarray(self.rgb())
+
+    def _to_rgb_planar(self) -> np.ndarray:
+        # Go from whichever interleaved array we've already got (or is cheapest) to avoid an extra conversion:
+        if self._bgr is not None and self._rgb is None:
+            return np.ascontiguousarray(self._bgr.transpose(2, 0, 1)[::-1])
+        return np.ascontiguousarray(self.rgb().transpose(2, 0, 1))
+
+
+class _ArrayImg(_SpecializedImg):
+    __slots__ = ()
+
+    def _get_size(self) -> ImgSize:
+        h, w = self._source.shape[:2]
+        return ImgSize(w=w, h=h)
+
+    def _copy_source(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        if out is None:
+            return self._contiguous(self._source)
+        np.copyto(out, self._source)
+        return out
+
+
+class _RgbImg(_ArrayImg):
+    __slots__ = ()
+    _own_slot = "_rgb"
+
+    def _to_rgb(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return _ArrayImg._copy_source(self, out=out)
+
+    def _to_bgr(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return cv2.cvtColor(self._source, cv2.COLOR_RGB2BGR, dst=out)
+
+
+class _BgrImg(_ArrayImg):
+    __slots__ = ()
+    _own_slot = "_bgr"
+    _rgb_from_bgr_view = True
+    _bgr_from_rgb_view = False
+
+    def _to_rgb(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return cv2.cvtColor(self._source, cv2.COLOR_BGR2RGB, dst=out)
+
+    def _to_bgr(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return _ArrayImg._copy_source(self, out=out)
+
+    def _to_pil(self) -> "PILImageModule.Image":
+        source = self._source
+        if (
+            self._rgb is not None
+            or source.ndim != 3
+            or source.shape[2] != 3
+            or not source.flags.c_contiguous
+            or source.dtype != np.uint8
+        ):
+            return _SpecializedImg._to_pil(self)
+        # Have PIL unpack the BGR pixels straight into its own (RGB) storage, rather than converting to an intermediate
+        # RGB array first. (For "BGR" PIL copies rather than sharing the buffer, so this won't alias the source.)
+        return PILImageModule.frombuffer("RGB", (self.w, self.h), source, "raw", "BGR", 0, 1)
+
+
+class _RgbPlanarImg(_SpecializedImg):
+    __slots__ = ()
+    _own_slot = "_rgb_planar"
+
+    def _get_size(self) -> ImgSize:
+        h, w = self._source.shape[1:]
+        return ImgSize(w=w, h=h)
+
+    def _to_rgb(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return cv2.merge(list(self._source), dst=out)
+
+    def _to_bgr(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return cv2.merge(list(self._source[::-1]), dst=out)
+
+    def _to_rgb_planar(self) -> np.ndarray:
+        return self._contiguous(self._source)
+
+
+class _PilImg(_SpecializedImg):
+    __slots__ = ()
+    _own_slot = "_pil"
+
+    def _get_size(self) -> ImgSize:
+        w, h = self._source.size
+        return ImgSize(w=w, h=h)
+
+    def _to_rgb(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return self._pil_to_numpy(self._source, out=out)
+
+    def _to_bgr(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        if self._rgb is None and self._source.mode == "RGB":
+            return self._pil_to_numpy(self._source, rawmode="BGR", out=out)
+        return cv2.cvtColor(self.rgb(), cv2.COLOR_RGB2BGR, dst=out)
+
+    def _to_pil(self) -> "PILImageModule.Image":
+        return self._source
+
+
+_IMG_CLASSES = {ImgType.RGB: _RgbImg, ImgType.BGR: _BgrImg, ImgType.RGB_PLANAR: _RgbPlanarImg, ImgType.PIL: _PilImg}
+
+
 # Ewwww, getting around circular imports ...
 from awareutils.vision.draw import Drawer, OpenCVDrawer, PILDrawer
 
@@ -360,6 +898,8 @@ def draw(self) -> Union[Drawer]:
             self._draw = PILDrawer(img=self, reproject_shapes_if_required=True)
         elif self.itype in (ImgType.RGB, ImgType.BGR):
             self._draw = OpenCVDrawer(img=self, reproject_shapes_if_required=True)
+        else:
+            raise RuntimeError(f"Drawing isn't supported for {self.itype.name} imgs - convert to RGB or BGR first")
     return self._draw
 
 
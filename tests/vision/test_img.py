@@ -1,11 +1,16 @@
+import math
 import os
 import tempfile
 import time
+from pathlib import Path
 
+import cv2
 import numpy as np
+import piexif
 import pytest
-from awareutils.vision.img import Img, ImgSize, ImgType
-from awareutils.vision.shape import Rectangle
+from awareutils.vision.col import Col
+from awareutils.vision.img import BufferPool, Img, ImgSize, ImgType, Interpolation, _read_exif_user_comment
+from awareutils.vision.shape import Circle, Line, Pixel, PolyLine, Polygon, Rectangle
 from PIL import Image as PILImage
 
 xfail = pytest.mark.xfail
@@ -30,6 +35,21 @@ class TempFilePath(object):
         time.sleep(0.1)
 
 
+def _img_from_rgb(rgb: np.ndarray, itype: ImgType, cls: type = Img) -> Img:
+    """
+    Create an img of the given itype with the same pixels as the RGB array.
+    """
+    if itype == ImgType.BGR:
+        source = np.ascontiguousarray(rgb[:, :, ::-1])
+    elif itype == ImgType.RGB:
+        source = rgb
+    elif itype == ImgType.PIL:
+        source = PILImage.fromarray(rgb)
+    elif itype == ImgType.RGB_PLANAR:
+        source = np.ascontiguousarray(rgb.transpose(2, 0, 1))
+    return cls(source=source, itype=itype)
+
+
 def test_isize_constructor():
     ImgSize(w=100, h=100)
     with pytest.raises(Exception):
@@ -46,11 +66,30 @@ def test_bgr_constructor():
     Img(EMPTY_ARRAY, ImgType.BGR)
 
 
+def test_rgb_planar_constructor():
+    Img(source=EMPTY_ARRAY.transpose(2, 0, 1), itype=ImgType.RGB_PLANAR)
+    with pytest.raises(Exception):
+        Img(source=EMPTY_ARRAY[:, :4, :], itype=ImgType.RGB_PLANAR)
+
+
 def test_pil_constructor():
     Img(source=EMPTY_PIL, itype=ImgType.PIL)
     Img(EMPTY_PIL, ImgType.PIL)
 
 
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
+def test_specialized_subclass(itype: ImgType):
+    img = Img.new(size=ImgSize(h=10, w=10), itype=itype)
+    assert isinstance(img, Img)
+    assert type(img) is not Img
+    assert img.itype == itype
+
+
+def test_unknown_itype():
+    with pytest.raises(RuntimeError):
+        Img(source=EMPTY_ARRAY, itype="RGB")
+
+
 def test_from_bgr():
     img = Img.from_bgr(EMPTY_ARRAY)
     assert img.itype == ImgType.BGR
@@ -62,8 +101,8 @@ def test_from_rgb():
 
 
 @pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
-@pytest.mark.parametrize("itype_save", [ImgType.BGR, ImgType.RGB, ImgType.PIL])
-@pytest.mark.parametrize("itype_open", [ImgType.BGR, ImgType.RGB, ImgType.PIL])
+@pytest.mark.parametrize("itype_save", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
+@pytest.mark.parametrize("itype_open", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
 @pytest.mark.parametrize("do_metadata", [True, False])
 def test_save_load_metadata(fmt, itype_save, itype_open, do_metadata):
 
@@ -74,6 +113,8 @@ def test_save_load_metadata(fmt, itype_save, itype_open, do_metadata):
         img = Img.from_rgb(EMPTY_ARRAY, metadata=metadata)
     elif itype_save == ImgType.PIL:
         img = Img.from_pil(EMPTY_PIL, metadata=metadata)
+    elif itype_save == ImgType.RGB_PLANAR:
+        img = Img.from_rgb_planar(EMPTY_ARRAY.transpose(2, 0, 1), metadata=metadata)
     with tempfile.NamedTemporaryFile() as f:
         f.close()  # 'cos it opens it opened
         fpath = f"{f.name}.{fmt.lower()}"
@@ -86,7 +127,7 @@ def test_save_load_metadata(fmt, itype_save, itype_open, do_metadata):
             assert img.metadata is None
 
 
-@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL])
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
 @pytest.mark.parametrize("meta", [True, False])
 def test_img_resize(itype: ImgType, meta: bool):
     # Check resizes, preserves metadata etc.
@@ -102,7 +143,33 @@ def test_img_resize(itype: ImgType, meta: bool):
         assert resized.metadata == {"a": 1}
 
 
-@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL])
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
+@pytest.mark.parametrize("interpolation", [None, *Interpolation])
+@pytest.mark.parametrize("upscale", [True, False])
+def test_img_resize_interpolation(itype: ImgType, interpolation: Interpolation, upscale: bool):
+    s0 = ImgSize(h=20, w=20)
+    s1 = ImgSize(h=40, w=30) if upscale else ImgSize(h=10, w=5)
+    rgb = np.random.randint(low=0, high=255, size=(s0.h, s0.w, 3), dtype=np.uint8)
+    resized = _img_from_rgb(rgb, itype).resize(s1, interpolation=interpolation)
+    assert resized.isize == s1
+
+    def reference(interpolation: Interpolation) -> np.ndarray:
+        if itype == ImgType.PIL:
+            return np.asarray(PILImage.fromarray(rgb).resize((s1.w, s1.h), resample=interpolation.pil))
+        if itype == ImgType.RGB_PLANAR:
+            # cv2 can round (e.g. CUBIC) slightly differently for single channels, so resize each plane like we do:
+            planes = [cv2.resize(rgb[:, :, c], (s1.w, s1.h), interpolation=interpolation.cv2) for c in range(3)]
+            return np.stack(planes, axis=2)
+        return cv2.resize(rgb, (s1.w, s1.h), interpolation=interpolation.cv2)
+
+    # By default, AREA for shrinking and LINEAR otherwise:
+    expected = interpolation or (Interpolation.LINEAR if upscale else Interpolation.AREA)
+    assert np.array_equal(resized.rgb(), reference(expected))
+    # And make sure that's actually telling the interpolations apart:
+    assert not any(np.array_equal(resized.rgb(), reference(i)) for i in Interpolation if i != expected)
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
 @pytest.mark.parametrize("meta", [True, False])
 @pytest.mark.parametrize("copy", [True, False])
 @pytest.mark.parametrize("wrong_crop_size", [True, False])
@@ -112,22 +179,32 @@ def test_img_crop(itype: ImgType, meta: bool, copy: bool, wrong_crop_size: bool)
     if meta:
         img.metadata = {"a": 1}
     rect = Rectangle.from_x0y0x1y1(x0=10, y0=10, x1=19, y1=19, isize=ImgSize(h=99, w=99) if wrong_crop_size else size)
-    if itype == ImgType.PIL and not copy:
-        # Can never ask not to copy for PIL
+    if wrong_crop_size:
         with pytest.raises(Exception):
             cropped = img.crop(rect, copy=copy)
     else:
-        if wrong_crop_size:
-            with pytest.raises(Exception):
-                cropped = img.crop(rect, copy=copy)
-        else:
-            cropped = img.crop(rect, copy=copy)
-            assert cropped.h == 10 and cropped.w == 10
-            if meta:
-                assert cropped.metadata == {"a": 1}
+        cropped = img.crop(rect, copy=copy)
+        assert cropped.h == 10 and cropped.w == 10
+        if meta:
+            assert cropped.metadata == {"a": 1}
 
 
-@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL])
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.RGB_PLANAR])
+@pytest.mark.parametrize("copy", [True, False])
+def test_img_crop_view(itype: ImgType, copy: bool):
+    rgb = np.random.randint(low=0, high=255, size=(100, 100, 3), dtype=np.uint8)
+    img = _img_from_rgb(rgb, itype)
+    rect = Rectangle.from_x0y0x1y1(x0=10, y0=10, x1=19, y1=19, isize=img.isize)
+    cropped = img.crop(rect, copy=copy)
+    # Array crops are views unless we asked for a copy:
+    assert np.shares_memory(cropped.source, img.source) != copy
+    # Either way, the conversions are right (and contiguous):
+    assert np.array_equal(cropped.rgb(), rgb[10:20, 10:20])
+    assert cropped.rgb().flags.c_contiguous
+    assert cropped.bgr().flags.c_contiguous
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
 @pytest.mark.parametrize("meta", [True, False])
 def test_img_new(itype: ImgType, meta: bool):
     if meta:
@@ -135,3 +212,339 @@ def test_img_new(itype: ImgType, meta: bool):
     else:
         img = Img.new(size=ImgSize(h=10, w=10), itype=itype, metadata={"a": 1})
     assert img is not None
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
+def test_img_new_col(itype: ImgType):
+    col = Col(10, 20, 30)
+    img = Img.new(size=ImgSize(h=10, w=10), itype=itype, col=col)
+    assert np.array_equal(img.rgb()[5, 5, :], col.rgb)
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
+def test_img_conversions(itype: ImgType):
+    rgb = np.random.randint(low=0, high=255, size=(10, 20, 3), dtype=np.uint8)
+    img = _img_from_rgb(rgb, itype)
+    assert img.h == 10 and img.w == 20
+    assert np.array_equal(img.rgb(), rgb)
+    assert np.array_equal(img.bgr(), rgb[:, :, ::-1])
+    assert np.array_equal(np.asarray(img.pil()), rgb)
+    assert np.array_equal(img.rgb_planar(), rgb.transpose(2, 0, 1))
+    assert img.rgb_planar().flags.c_contiguous
+    assert img.rgb().flags.c_contiguous
+    assert img.bgr().flags.c_contiguous
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL])
+def test_img_conversion_cache(itype: ImgType):
+    img = Img.new(size=ImgSize(h=10, w=10), itype=itype)
+    # Conversions are cached:
+    assert img.rgb() is img.rgb()
+    assert img.bgr() is img.bgr()
+    assert img.pil() is img.pil()
+    # But are invalidated by drawing:
+    rect = Rectangle.from_x0y0x1y1(x0=0, y0=0, x1=4, y1=4, isize=img.isize)
+    img.draw.rectangle(rect, fill=Col.named.white)
+    assert np.array_equal(img.rgb()[0, 0, :], (255, 255, 255))
+    assert np.array_equal(img.bgr()[0, 0, :], (255, 255, 255))
+    # And by reassigning the source:
+    img.source = Img.new(size=ImgSize(h=10, w=10), itype=itype).source
+    assert np.array_equal(img.rgb()[0, 0, :], (0, 0, 0))
+    # Which also means drawing on the new source, not the old one:
+    img.draw.rectangle(rect, fill=Col.named.white)
+    assert np.array_equal(img.rgb()[0, 0, :], (255, 255, 255))
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL])
+@pytest.mark.parametrize("shape", ["pixel", "rectangle", "line", "polyline", "polygon", "circle"])
+def test_img_conversion_cache_shapes(itype: ImgType, shape: str):
+    img = Img.new(size=ImgSize(h=10, w=10), itype=itype)
+    img.rgb(), img.bgr(), img.pil()
+    isize = img.isize
+    p0, p1, p2 = Pixel(x=0, y=0, isize=isize), Pixel(x=2, y=2, isize=isize), Pixel(x=4, y=0, isize=isize)
+    white = Col.named.white
+    if shape == "pixel":
+        img.draw.pixel(p1, fill=white)
+    elif shape == "rectangle":
+        img.draw.rectangle(Rectangle.from_x0y0x1y1(x0=0, y0=0, x1=4, y1=4, isize=isize), fill=white)
+    elif shape == "line":
+        img.draw.line(Line(p0=p0, p1=p1), outline=white)
+    elif shape == "polyline":
+        img.draw.polyline(PolyLine(pixels=[p0, p1, p2]), outline=white)
+    elif shape == "polygon":
+        img.draw.polygon(Polygon(pixels=[p0, p1, p2]), fill=white, outline=white)
+    elif shape == "circle":
+        img.draw.circle(Circle(center=p1, radius=2), fill=white)
+    # Every kind of drawing should invalidate the cached conversions:
+    assert np.array_equal(img.rgb()[2, 2, :], (255, 255, 255))
+    assert np.array_equal(img.bgr()[2, 2, :], (255, 255, 255))
+    assert np.array_equal(np.asarray(img.pil())[2, 2, :], (255, 255, 255))
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL])
+def test_img_conversions_no_copy(itype: ImgType):
+    rgb = np.random.randint(low=0, high=255, size=(10, 20, 3), dtype=np.uint8)
+    img = _img_from_rgb(rgb, itype)
+    if itype == ImgType.BGR:
+        assert np.shares_memory(img.rgb(copy=False), img.source)
+    elif itype == ImgType.RGB:
+        assert np.shares_memory(img.bgr(copy=False), img.source)
+    assert np.array_equal(img.rgb(copy=False), rgb)
+    assert np.array_equal(img.bgr(copy=False), rgb[:, :, ::-1])
+
+
+def test_img_conversions_no_copy_rgba():
+    # Not 3 channels, so can't just be a reversed view - we should get the same as a normal conversion:
+    rgba = np.random.randint(low=0, high=255, size=(10, 20, 4), dtype=np.uint8)
+    bgr = Img.from_pil(PILImage.fromarray(rgba)).bgr(copy=False)
+    assert np.array_equal(bgr, Img.from_pil(PILImage.fromarray(rgba)).bgr())
+
+
+def test_pil_to_bgr():
+    rgb = np.random.randint(low=0, high=255, size=(10, 20, 3), dtype=np.uint8)
+    # Without rgb() first, so we go straight from PIL to BGR:
+    bgr = Img.from_pil(PILImage.fromarray(rgb)).bgr()
+    assert np.array_equal(bgr, rgb[:, :, ::-1])
+    assert bgr.flags.c_contiguous
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB])
+@pytest.mark.parametrize("make_arrays_contiguous", [True, False])
+def test_img_non_contiguous_source(itype: ImgType, make_arrays_contiguous: bool):
+    arr = np.random.randint(low=0, high=255, size=(10, 20, 3), dtype=np.uint8)[:, ::2, :]
+    img = Img(source=arr, itype=itype, make_arrays_contiguous=make_arrays_contiguous)
+    assert img.source.flags.c_contiguous == make_arrays_contiguous
+    rgb = arr if itype == ImgType.RGB else arr[:, :, ::-1]
+    assert np.array_equal(img.rgb(), rgb)
+    assert np.array_equal(np.asarray(img.pil()), rgb)
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB])
+def test_open_with_metadata_is_writeable(itype: ImgType):
+    img = Img.from_rgb(EMPTY_ARRAY, metadata={"a": 1})
+    with TempFilePath(suffix=".png") as f:
+        img.save(f.path)
+        img = Img.open(f.path, itype=itype, load_metadata=True)
+    assert img.source.flags.writeable
+    assert img.metadata == {"a": 1}
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
+def test_open_batch(itype: ImgType):
+    rgbs = [np.full((10, 10, 3), i, np.uint8) for i in range(5)]
+    paths = []
+    try:
+        for rgb in rgbs:
+            with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+                paths.append(Path(f.name))
+            Img.from_rgb(rgb).save(paths[-1])
+        imgs = Img.open_batch(paths, itype=itype)
+        assert all(img.itype == itype for img in imgs)
+        if itype == ImgType.PIL:
+            # They should've been decoded in the threads, and their files closed:
+            assert all(img.source.fp is None for img in imgs)
+        assert all(np.array_equal(img.rgb(), rgb) for img, rgb in zip(imgs, rgbs))
+        assert all(img.itype == ImgType.BGR for img in Img.open_bgr_batch(paths))
+    finally:
+        for path in paths:
+            os.remove(path)
+
+
+def test_open_bad_path():
+    with pytest.raises(ValueError):
+        Img.open(1, itype=ImgType.BGR)
+
+
+def test_open_save_str_subclass_path():
+    # e.g. paths from a numpy array of strs are np.str_, which is a str subclass:
+    rgb = np.random.randint(low=0, high=255, size=(10, 20, 3), dtype=np.uint8)
+    with TempFilePath(suffix=".png") as f:
+        path = np.array([f.path])[0]
+        assert type(path) is not str
+        Img.from_rgb(rgb).save(path)
+        assert np.array_equal(Img.open_rgb(path).rgb(), rgb)
+        assert np.array_equal(Img.open_batch([path], itype=ImgType.RGB)[0].rgb(), rgb)
+
+
+def test_read_exif_user_comment():
+    exif = piexif.dump({"0th": {piexif.ImageIFD.Make: b"foo"}, "Exif": {piexif.ExifIFD.UserComment: b"[1, 2, 3]"}})
+    assert _read_exif_user_comment(exif) == b"[1, 2, 3]"
+    # Short values are stored inline:
+    exif = piexif.dump({"Exif": {piexif.ExifIFD.UserComment: b"1"}})
+    assert _read_exif_user_comment(exif) == b"1"
+    # And no UserComment:
+    exif = piexif.dump({"0th": {piexif.ImageIFD.Make: b"foo"}})
+    assert _read_exif_user_comment(exif) is None
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
+@pytest.mark.parametrize("cached", [True, False])
+def test_img_conversions_out(itype: ImgType, cached: bool):
+    rgb = np.random.randint(low=0, high=255, size=(10, 20, 3), dtype=np.uint8)
+    img = _img_from_rgb(rgb, itype)
+    if cached:
+        img.rgb()
+        img.bgr()
+    pool = BufferPool()
+    out = pool.get((10, 20, 3))
+    assert img.rgb(out=out) is out
+    assert np.array_equal(out, rgb)
+    assert img.bgr(out=out) is out
+    assert np.array_equal(out, rgb[:, :, ::-1])
+    pool.release(out)
+    assert pool.get((10, 20, 3)) is out
+    with pytest.raises(ValueError):
+        img.rgb(out=np.empty((10, 10, 3), np.uint8))
+
+
+def test_buffer_pool_release():
+    pool = BufferPool()
+    arr = pool.get((10, 20, 3))
+    # Releasing twice only pools it once, so it's not handed out twice:
+    pool.release(arr)
+    pool.release(arr)
+    assert pool.get((10, 20, 3)) is arr
+    assert pool.get((10, 20, 3)) is not arr
+    # Non-contiguous arrays can't be written into by conversions, so aren't accepted:
+    with pytest.raises(ValueError):
+        pool.release(np.empty((10, 40, 3), np.uint8)[:, ::2])
+
+
+def test_batch():
+    rgbs = [np.random.randint(low=0, high=255, size=(10, 20, 3), dtype=np.uint8) for _ in range(4)]
+    imgs = [
+        Img.from_rgb(rgbs[0]),
+        Img.from_bgr(np.ascontiguousarray(rgbs[1][:, :, ::-1])),
+        Img.from_pil(PILImage.fromarray(rgbs[2])),
+        Img.from_rgb_planar(rgbs[3].transpose(2, 0, 1)),
+    ]
+    assert np.array_equal(Img.batch_rgb(imgs), np.stack(rgbs))
+    out = np.empty((4, 10, 20, 3), np.uint8)
+    assert Img.batch_bgr(imgs, out=out) is out
+    assert np.array_equal(out, np.stack(rgbs)[..., ::-1])
+    with pytest.raises(ValueError):
+        Img.batch_rgb(imgs + [Img.new_rgb(ImgSize(h=10, w=10))])
+    # The wrong number of imgs, dtype, or a non-contiguous out:
+    for bad_out in [
+        np.empty((5, 10, 20, 3), np.uint8),
+        np.empty((3, 10, 20, 3), np.uint8),
+        np.empty((4, 10, 20, 3), np.float32),
+        np.empty((4, 10, 40, 3), np.uint8)[:, :, ::2],
+    ]:
+        with pytest.raises(ValueError):
+            Img.batch_rgb(imgs, out=bad_out)
+    # Non-uint8 imgs are batched with their own dtype:
+    floats = [Img.from_rgb(rgb.astype(np.float32)) for rgb in rgbs]
+    assert Img.batch_rgb(floats).dtype == np.float32
+
+
+def test_save_metadata_cache():
+    img = Img.from_rgb(EMPTY_ARRAY, metadata={"a": 1})
+    with TempFilePath(suffix=".png") as f:
+        img.save(f.path)
+        assert Img.open_rgb(f.path, load_metadata=True).metadata == {"a": 1}
+        # Mutated in place:
+        img.metadata["a"] = 2
+        img.save(f.path)
+        assert Img.open_rgb(f.path, load_metadata=True).metadata == {"a": 2}
+        # And set:
+        img.metadata = {"b": 3}
+        img.save(f.path)
+        assert Img.open_rgb(f.path, load_metadata=True).metadata == {"b": 3}
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB])
+def test_open_big(itype: ImgType):
+    # Big enough to be memory mapped when reading:
+    rgb = np.random.randint(low=0, high=255, size=(1000, 1000, 3), dtype=np.uint8)
+    with TempFilePath(suffix=".png") as f:
+        Img.from_rgb(rgb).save(f.path)
+        assert os.path.getsize(f.path) > 1 << 20
+        assert np.array_equal(Img.open(f.path, itype=itype).rgb(), rgb)
+
+
+def test_open_missing():
+    with pytest.raises(RuntimeError):
+        Img.open_bgr("/this/does/not/exist.png")
+
+
+def test_open_big_unreadable(monkeypatch):
+    # Make everything big enough to be memory mapped:
+    monkeypatch.setattr("awareutils.vision.img._MMAP_MIN_FILE_SIZE", 1)
+    # Can't be opened:
+    with tempfile.TemporaryDirectory() as path:
+        with pytest.raises(RuntimeError):
+            Img.open_bgr(path)
+    # Can't be decoded:
+    with TempFilePath(suffix=".png") as f:
+        with open(f.path, "wb") as fp:
+            fp.write(b"not an img")
+        with pytest.raises(RuntimeError):
+            Img.open_bgr(f.path)
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
+@pytest.mark.parametrize("optimize", [True, False])
+def test_save_optimize(fmt: str, optimize: bool):
+    img = Img.from_pil(EMPTY_PIL)
+    with TempFilePath(suffix=f".{fmt.lower()}") as f:
+        img.save(f.path, format=fmt, optimize=optimize)
+        assert Img.open_pil(f.path).isize == img.isize
+
+
+def test_bgr_to_pil():
+    rgb = np.random.randint(low=0, high=255, size=(10, 20, 3), dtype=np.uint8)
+    bgr = np.ascontiguousarray(rgb[:, :, ::-1])
+    # Straight from BGR (i.e. no RGB cached):
+    pil = Img.from_bgr(bgr).pil()
+    assert np.array_equal(np.asarray(pil), rgb)
+    # And it's a copy:
+    bgr[:] = 0
+    assert np.array_equal(np.asarray(pil), rgb)
+
+
+def test_bgra_to_pil():
+    bgra = np.random.randint(low=0, high=255, size=(10, 20, 4), dtype=np.uint8)
+    expected = cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB)
+    assert np.array_equal(np.asarray(Img.from_bgr(bgra).pil()), expected)
+    # And the same whether or not RGB is already cached:
+    img = Img.from_bgr(bgra)
+    img.rgb()
+    assert np.array_equal(np.asarray(img.pil()), expected)
+
+
+def test_save_load_metadata_json_edge_cases():
+    img = Img.from_rgb(EMPTY_ARRAY, metadata={"score": float("nan"), "inf": float("inf"), "big": 2**70})
+    with TempFilePath(suffix=".png") as f:
+        img.save(f.path)
+        metadata = Img.open_rgb(f.path, load_metadata=True).metadata
+    assert math.isnan(metadata["score"])
+    assert metadata["inf"] == float("inf")
+    assert metadata["big"] == 2**70
+    assert isinstance(metadata["big"], int)
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
+def test_user_subclass(itype: ImgType):
+    class MyImg(Img):
+        pass
+
+    rgb = np.random.randint(low=0, high=255, size=(10, 20, 3), dtype=np.uint8)
+    img = _img_from_rgb(rgb, itype, cls=MyImg)
+    assert type(img) is MyImg
+    assert img.h == 10 and img.w == 20
+    assert np.array_equal(img.rgb(), rgb)
+    assert np.array_equal(img.bgr(), rgb[:, :, ::-1])
+    assert np.array_equal(np.asarray(img.pil()), rgb)
+    assert np.array_equal(img.rgb_planar(), rgb.transpose(2, 0, 1))
+
+
+@pytest.mark.parametrize("itype", [ImgType.BGR, ImgType.RGB, ImgType.PIL, ImgType.RGB_PLANAR])
+def test_own_type_cached(itype: ImgType):
+    rgb = np.random.randint(low=0, high=255, size=(10, 20, 3), dtype=np.uint8)
+    img = _img_from_rgb(rgb, itype)
+    source = img.source
+    getter = {ImgType.BGR: img.bgr, ImgType.RGB: img.rgb, ImgType.PIL: img.pil, ImgType.RGB_PLANAR: img.rgb_planar}
+    assert getter[itype]() is source
+    img.invalidate_cache()
+    assert getter[itype]() is source